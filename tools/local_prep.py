@@ -13,16 +13,43 @@ Flags you might care about:
   --force-images  (rebuild image variants even if up-to-date)
   --force-videos  (rebuild poster/webm even if up-to-date)
   --no-fallback-raster (don’t create JPEG/PNG resized fallbacks)
+  --jobs N        (parallel image encode workers; default: CPU count)
+  --avif-encoder {svt,aom} (AV1 encoder for AVIF stills; default: svt)
+  --video-jobs N  (concurrent ffmpeg video jobs; default: CPU count / 4)
+  --force-html    (rewrite HTML even if it looks up-to-date)
+  --pretty        (re-indent the rewritten HTML; slower)
   --dry-run       (show what would happen)
+
+Optional speedups:
+  pip install opencv-python-headless   (SIMD resize, used automatically; note it
+                                        switches reductions of 2x or more from
+                                        LANCZOS to INTER_AREA, so output differs)
+  pip install pillow-simd              (drop-in Pillow with SIMD LANCZOS)
 """
 
 from __future__ import annotations
-import argparse, os, re, shutil, subprocess, sys, time
+import argparse, atexit, json, os, re, shutil, subprocess, sys, time
+from html import escape
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 
 from PIL import Image
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, FeatureNotFound
+
+try:
+    import cv2
+    import numpy as np
+    cv2.setNumThreads(1)  # parallelism comes from the process pool
+    _HAVE_CV2 = True
+except ImportError:
+    _HAVE_CV2 = False
+
+_WIDTH_EXT_RE = re.compile(r"-(\d+)\.(?:webp|avif|jpe?g|png)$")
+_WIDTH_DOT_RE = re.compile(r"-(\d+)\.")
+_WIDTH_SUFFIX_RE = re.compile(r"-\d+$")
+_MP4_RE = re.compile(r"assets/media/(video\d+)\.mp4$")
 
 # ---------------- Utilities ----------------
 
@@ -38,8 +65,19 @@ def need(cmd: str):
     if not which(cmd):
         raise SystemExit(f"Required executable not found on PATH: {cmd}")
 
-def run(cmd: List[str]) -> subprocess.CompletedProcess:
-    return subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+# Common ffmpeg prefix: never read stdin, and only print real errors.
+FFMPEG = ["ffmpeg","-nostdin","-hide_banner","-loglevel","error","-y"]
+
+def run(cmd: List[str], capture: bool = False) -> subprocess.CompletedProcess:
+    """Run cmd, raising on failure.
+
+    Output is only piped when capture=True (ffprobe). Otherwise stdout goes to
+    DEVNULL and stderr passes straight through, so long encodes can't stall on
+    a full pipe and errors still reach the terminal.
+    """
+    if capture:
+        return subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return subprocess.run(cmd, check=True, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
 
 def ensure_parent(p: Path):
     p.parent.mkdir(parents=True, exist_ok=True)
@@ -52,57 +90,173 @@ def backup_file(path: Path) -> Path:
     shutil.copy2(path, b)
     return b
 
+def _fast_relpath(child_posix: str, start_posix: str) -> str:
+    """relpath for POSIX-style strings; a prefix strip in the common child-of-start case."""
+    if child_posix.startswith(start_posix + "/"):
+        return child_posix[len(start_posix) + 1:]
+    return os.path.relpath(child_posix, start_posix).replace("\\", "/")
+
 def relpath(child: Path, start: Path) -> str:
-    return os.path.relpath(child.as_posix(), start.as_posix()).replace("\\", "/")
+    return _fast_relpath(child.as_posix(), start.as_posix())
 
 def is_raster(ext: str) -> bool:
     return ext.lower() in {".jpg", ".jpeg", ".png"}
 
-def newer_than(src: Path, dest: Path) -> bool:
-    """Return True if dest exists and is newer than src."""
-    return dest.exists() and dest.stat().st_mtime > src.stat().st_mtime
+def stale_against(src_mtime: float, dest: Path) -> bool:
+    """Return True if dest is missing or not newer than src_mtime (one stat, no src stat)."""
+    try:
+        return dest.stat().st_mtime <= src_mtime
+    except FileNotFoundError:
+        return True
+
+# ---------------- Cache ----------------
+
+_cache_path = Path(".local_prep_cache.json")
+PROBE_CACHE: Dict[str, float] = {}  # "path:mtime_ns:size" -> duration seconds
+HTML_STATE: Dict[str, int] = {}     # "html path:passes" -> html mtime_ns after last consistent rewrite
+_cache_dirty = False
+
+def load_cache(persist: bool = True):
+    """Load the cache; with persist=False (dry runs) it is read but never written back."""
+    global PROBE_CACHE, HTML_STATE
+    try:
+        data = json.loads(_cache_path.read_text(encoding="utf-8"))
+        PROBE_CACHE = {k: float(v) for k, v in data.get("probe", {}).items()}
+        HTML_STATE = {k: int(v) for k, v in data.get("html", {}).items()}
+    except (OSError, ValueError, AttributeError):
+        PROBE_CACHE, HTML_STATE = {}, {}
+    if persist:
+        atexit.register(save_cache)
+
+def save_cache():
+    """Write the cache atomically (tmp file + rename), only if it changed."""
+    if not _cache_dirty:
+        return
+    tmp = _cache_path.with_name(_cache_path.name + ".tmp")
+    try:
+        data = {"probe": PROBE_CACHE, "html": HTML_STATE}
+        tmp.write_text(json.dumps(data, indent=1, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, _cache_path)
+    except OSError as e:
+        warn(f"Could not write cache {_cache_path}: {e}")
 
 # ---------------- Image ops ----------------
 
-def pillow_resize(src: Path, out: Path, width: int, fmt: str, quality: int = 82, effort: int = 4):
+def _save_webp(im: Image.Image, out: Path, quality: int = 82):
     ensure_parent(out)
-    with Image.open(src) as im:
-        w, h = im.size
-        if w <= width:
-            new_w, new_h = w, h
-        else:
-            new_w = width
-            new_h = int(round(h * (width / float(w))))
-        if im.mode not in ("RGB", "L"):
-            im = im.convert("RGB")
-        im = im.resize((new_w, new_h), Image.LANCZOS)
-
-        fmt_lower = fmt.lower()
-        if fmt_lower == "webp":
-            im.save(out, format="WEBP", quality=quality, method=6)
-        elif fmt_lower in ("jpg", "jpeg"):
-            im.save(out, format="JPEG", quality=quality, optimize=True, progressive=True)
-        elif fmt_lower == "png":
-            im.save(out, format="PNG", optimize=True)
-        elif fmt_lower == "avif":
-            try:
-                im.save(out, format="AVIF", quality=max(1, min(quality, 100)), effort=effort)
-            except Exception:
-                _encode_avif_ffmpeg(src, out, width)
-        else:
-            raise ValueError(f"Unsupported format: {fmt}")
+    im.save(out, format="WEBP", quality=quality, method=6)
 
-def _encode_avif_ffmpeg(src: Path, out: Path, width: int, crf: int = 28, cpu_used: int = 6):
-    need("ffmpeg")
+def pillow_can_save_avif() -> bool:
+    Image.init()
+    return "AVIF" in Image.SAVE
+
+def _pillow_avif_codec(encoder: str) -> str:
+    """encoder if Pillow's libavif was built with it, else "auto" (whatever it has)."""
+    try:
+        from PIL import AvifImagePlugin
+        if AvifImagePlugin._avif.encoder_codec_available(encoder):
+            return encoder
+    except (ImportError, AttributeError):
+        pass
+    return "auto"
+
+def _save_avif(im: Image.Image, out: Path, quality: int = 82, effort: int = 4, encoder: str = "svt") -> bool:
+    """Save via Pillow's AVIF plugin; False if unavailable so the caller can use ffmpeg."""
     ensure_parent(out)
-    vf = f"scale='min({width},iw)':'-2':flags=lanczos"
-    cmd = [
-        "ffmpeg","-y","-i",str(src),
-        "-vf",vf,"-frames:v","1",
-        "-c:v","libaom-av1","-still_picture","1",
-        "-pix_fmt","yuv420p10le","-crf",str(crf),"-cpu-used",str(cpu_used),
-        str(out)
-    ]
+    try:
+        im.save(out, format="AVIF", quality=max(1, min(quality, 100)), effort=effort,
+                codec=_pillow_avif_codec(encoder), subsampling="4:2:0", range="full")
+        return True
+    except Exception:
+        return False
+
+def _save_fallback(im: Image.Image, out: Path, fmt: str, quality: int = 82):
+    ensure_parent(out)
+    fmt_lower = fmt.lower()
+    if fmt_lower in ("jpg", "jpeg"):
+        im.save(out, format="JPEG", quality=quality, optimize=True, progressive=True)
+    elif fmt_lower == "png":
+        im.save(out, format="PNG", optimize=True)
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+def _resize_buffer(im: Image.Image, width: int, w0: int, h0: int) -> Image.Image:
+    """Resize an already decoded buffer to width (never upscales).
+
+    Pillow's LANCZOS without OpenCV. With cv2 installed: INTER_LANCZOS4 for
+    reductions under 2x, INTER_AREA for 2x or more (typically the first,
+    full-res step of the chain), so output depends on whether cv2 is present.
+    Height comes from the original w0 x h0 aspect so chained resizes don't
+    accumulate rounding drift.
+    """
+    new_w = min(width, w0)
+    new_h = int(round(h0 * (new_w / float(w0))))
+    if im.size == (new_w, new_h):
+        return im
+    if _HAVE_CV2:
+        # LANCZOS4 is a fixed 8x8 kernel and aliases on big reductions; INTER_AREA
+        # is OpenCV's antialiased choice there.
+        interp = cv2.INTER_AREA if im.size[0] >= 2 * new_w else cv2.INTER_LANCZOS4
+        return Image.fromarray(cv2.resize(np.asarray(im), (new_w, new_h), interpolation=interp))
+    return im.resize((new_w, new_h), Image.LANCZOS)
+
+def _encode_source(src_str: str, plan: List[Tuple[int, Dict[str, str]]], quality: int = 82, effort: int = 4,
+                   avif_encoder: str = "svt"):
+    """Decode src once and render every planned width, largest first.
+
+    Each smaller width is resampled from the previous (larger) rendition
+    rather than from the full-resolution original. Top-level with plain
+    str args so it pickles cleanly into the process pool.
+    """
+    src = Path(src_str)
+    avif_via_ffmpeg: Dict[int, Path] = {}
+    with Image.open(src) as im:
+        im.load()
+        w0, h0 = im.size
+        current = im.convert("RGB") if im.mode not in ("RGB", "L") else im
+        for width, outs in sorted(plan, key=lambda item: item[0], reverse=True):
+            current = _resize_buffer(current, width, w0, h0)
+            for key, out_str in outs.items():
+                out = Path(out_str)
+                if key == "webp":
+                    _save_webp(current, out, quality)
+                elif key == "avif":
+                    if not _save_avif(current, out, quality, effort, avif_encoder):
+                        avif_via_ffmpeg[current.size[0]] = out
+                else:
+                    _save_fallback(current, out, out.suffix.lstrip("."), quality)
+    if avif_via_ffmpeg:
+        _encode_avif_ffmpeg_multi(src, avif_via_ffmpeg, encoder=avif_encoder)
+
+def _avif_codec_args(encoder: str, crf: int, cpu_used: int = 6) -> List[str]:
+    if encoder == "aom":
+        # usage is fixed at encoder creation (g_usage), so it needs ffmpeg's own
+        # -usage option; -aom-params only reaches libaom's extra controls.
+        return ["-c:v","libaom-av1","-usage","allintra","-still_picture","1","-crf",str(crf),"-cpu-used",str(cpu_used),
+                "-aom-params","enable-restoration=0:enable-cdef=0"]
+    if encoder == "svt":
+        # avif=1 switches SVT into single-frame mode (far fewer picture buffers).
+        return ["-c:v","libsvtav1","-preset","8","-crf",str(crf),
+                "-svtav1-params","avif=1:tune=0:fast-decode=1:enable-overlays=0"]
+    raise ValueError(f"Unsupported AVIF encoder: {encoder}")
+
+def _encode_avif_ffmpeg_multi(src: Path, outs_by_width: Dict[int, Path], crf: int = 28, encoder: str = "svt",
+                              cpu_used: int = 6):
+    """Encode every width from one ffmpeg process: decode once, split, scale per output."""
+    need("ffmpeg")
+    widths = sorted(outs_by_width, reverse=True)
+    n = len(widths)
+    graph = f"[0:v]split={n}" + "".join(f"[s{i}]" for i in range(n))
+    for i, w in enumerate(widths):
+        graph += f";[s{i}]scale='min({w},iw)':-2:flags=lanczos[o{i}]"
+    cmd = [*FFMPEG,"-i",str(src),"-filter_complex",graph]
+    for i, w in enumerate(widths):
+        out = outs_by_width[w]
+        ensure_parent(out)
+        cmd += ["-map",f"[o{i}]","-frames:v","1",
+                *_avif_codec_args(encoder, crf, cpu_used),
+                "-pix_fmt","yuv420p",
+                str(out)]
     run(cmd)
 
 def outputs_for_image(src: Path, width: int, want_fallback: bool) -> Dict[str, Path]:
@@ -116,20 +270,32 @@ def outputs_for_image(src: Path, width: int, want_fallback: bool) -> Dict[str, P
         outs["fallback"] = src.with_name(f"{base}-{width}{fallback_ext}")
     return outs
 
-def any_image_output_stale(src: Path, outs: Dict[str, Path]) -> bool:
-    """Return True if any output is missing or older than the source."""
+def any_image_output_stale(src_mtime: float, outs: Dict[str, Path], existing: Dict[str, float]) -> bool:
+    """Return True if any output is missing or older than the source.
+
+    existing maps file name -> mtime for images_dir (one scandir), so no
+    per-output stat is needed; sources and outputs share that directory.
+    """
     for p in outs.values():
-        if not p.exists() or not newer_than(src, p):
+        mtime = existing.get(p.name)
+        if mtime is None or mtime <= src_mtime:
             return True
     return False
 
-def generate_responsive_images(images_dir: Path, widths: List[int], make_fallback: bool, force: bool, dry: bool) -> int:
-    exts = {".jpg",".jpeg",".png",".webp",".avif"}
+def generate_responsive_images(images_dir: Path, widths: List[int], make_fallback: bool, force: bool, dry: bool,
+                               jobs: Optional[int] = None, avif_encoder: str = "svt") -> int:
+    exts = (".jpg",".jpeg",".png",".webp",".avif")
     touched_images = 0
+    pending: List[Tuple[str, List[Tuple[int, Dict[str, str]]]]] = []  # (src, [(width, outs)])
 
-    for src in sorted(images_dir.glob("*")):
-        if not src.is_file() or src.suffix.lower() not in exts:
-            continue
+    # One stat per directory entry (cached on the DirEntry); the staleness checks
+    # below then read this map instead of calling exists()/stat() per output.
+    with os.scandir(images_dir) as it:
+        files = [e for e in it if e.is_file()]
+    existing = {e.name: e.stat().st_mtime for e in files}
+    sources = sorted(images_dir / e.name for e in files if e.name.lower().endswith(exts))
+
+    for src in sources:
         try:
             with Image.open(src) as im:
                 w0,_ = im.size
@@ -137,58 +303,88 @@ def generate_responsive_images(images_dir: Path, widths: List[int], make_fallbac
             warn(f"Skipping unreadable image: {src}")
             continue
 
+        src_mtime = existing[src.name]
         did_any = False
+        plan: List[Tuple[int, Dict[str, str]]] = []
         for w in widths:
             if w0 < w:  # no upscaling
                 continue
 
             outs = outputs_for_image(src, w, want_fallback=make_fallback)
-            if not force and not any_image_output_stale(src, outs):
+            if not force and not any_image_output_stale(src_mtime, outs, existing):
                 continue  # up-to-date
 
             if dry:
                 log(f"[DRY] Would (re)generate: {', '.join(p.name for p in outs.values())}")
             else:
-                pillow_resize(src, outs["webp"], w, "webp")
-                pillow_resize(src, outs["avif"], w, "avif")
-                if "fallback" in outs:
-                    fmt = outs["fallback"].suffix.lstrip(".")
-                    pillow_resize(src, outs["fallback"], w, fmt)
+                plan.append((w, {k: str(v) for k, v in outs.items()}))
             did_any = True
 
+        if plan:
+            pending.append((str(src), plan))
         if did_any:
             touched_images += 1
         else:
             log(f"Skip (already up-to-date): {src.name}")
 
+    if pending:
+        workers = jobs or os.cpu_count() or 1
+        log(f"Encoding {len(pending)} source image(s) with {workers} worker(s)…")
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            list(ex.map(partial(_encode_source, avif_encoder=avif_encoder), *zip(*pending)))
+
     return touched_images
 
 # ---------------- Video ops ----------------
 
 def probe_duration(path: Path) -> float:
+    global _cache_dirty
+    st = path.stat()
+    key = f"{path}:{st.st_mtime_ns}:{st.st_size}"
+    if key in PROBE_CACHE:
+        return PROBE_CACHE[key]
     need("ffprobe")
     cmd = ["ffprobe","-v","error","-show_entries","format=duration","-of","default=nw=1:nk=1",str(path)]
     try:
-        out = run(cmd).stdout.decode().strip()
-        return float(out)
+        out = run(cmd, capture=True).stdout.decode().strip()
+        dur = float(out)
     except Exception:
         return 0.0
+    PROBE_CACHE[key] = dur
+    _cache_dirty = True
+    return dur
 
 def extract_poster(mp4: Path, out_jpg: Path, at_seconds: float):
     need("ffmpeg")
     ensure_parent(out_jpg)
-    cmd = ["ffmpeg","-y","-ss",f"{at_seconds:.3f}","-i",str(mp4),"-frames:v","1","-q:v","2",str(out_jpg)]
+    cmd = [*FFMPEG,"-ss",f"{at_seconds:.3f}","-i",str(mp4),"-frames:v","1","-q:v","2",str(out_jpg)]
     run(cmd)
 
-def encode_webm_av1(mp4: Path, out_webm: Path, crf: int = 30, cpu_used: int = 4, audio_bitrate: str = "128k"):
+def _webm_args(crf: int = 32, preset: int = 8, audio_bitrate: str = "128k", threads: int = 0) -> List[str]:
+    return [
+        "-c:v","libsvtav1","-preset",str(preset),"-crf",str(crf),
+        "-svtav1-params","tune=0:fast-decode=1","-pix_fmt","yuv420p","-threads",str(threads),
+        "-c:a","libopus","-b:a",audio_bitrate,
+        "-map_metadata","-1",
+    ]
+
+def encode_webm_av1_svt(mp4: Path, out_webm: Path, crf: int = 32, preset: int = 8, audio_bitrate: str = "128k",
+                        threads: int = 0):
     need("ffmpeg")
     ensure_parent(out_webm)
+    cmd = [*FFMPEG,"-i",str(mp4), *_webm_args(crf, preset, audio_bitrate, threads), str(out_webm)]
+    run(cmd)
+
+encode_webm_av1 = encode_webm_av1_svt  # old name, kept for callers
+
+def _process_video_fused(mp4: Path, poster_out: Path, webm_out: Path, t_poster: float, threads: int = 0):
+    """Poster + webm from one ffmpeg process, so the mp4 is decoded once."""
+    need("ffmpeg")
+    ensure_parent(poster_out); ensure_parent(webm_out)
     cmd = [
-        "ffmpeg","-y","-i",str(mp4),
-        "-c:v","libaom-av1","-crf",str(crf),"-b:v","0","-cpu-used",str(cpu_used),"-row-mt","1",
-        "-c:a","libopus","-b:a",audio_bitrate,
-        "-map_metadata","-1",
-        str(out_webm)
+        *FFMPEG,"-i",str(mp4),
+        "-map","0:v:0","-ss",f"{t_poster:.3f}","-frames:v","1","-q:v","2",str(poster_out),
+        "-map","0:v:0","-map","0:a?", *_webm_args(threads=threads), str(webm_out)
     ]
     run(cmd)
 
@@ -199,86 +395,118 @@ def video_outputs_for(mp4: Path) -> Dict[str, Path]:
         "webm": mp4.with_name(f"{base}.webm"),
     }
 
-def any_video_output_stale(mp4: Path, outs: Dict[str, Path]) -> bool:
+def any_video_output_stale(mp4_mtime: float, outs: Dict[str, Path]) -> bool:
     """True if any required output is missing or older than the mp4."""
     required = ["poster", "webm"]
     for k in required:
-        p = outs[k]
-        if not p.exists() or not newer_than(mp4, p):
+        if stale_against(mp4_mtime, outs[k]):
             return True
     return False
 
-def process_videos(media_dir: Path, force: bool, dry: bool) -> int:
-    touched = 0
-    for mp4 in sorted(media_dir.glob("video*.mp4")):
-        outs = video_outputs_for(mp4)
-        stale = any_video_output_stale(mp4, outs)
+def _process_one_video(mp4: Path, force: bool, dry: bool, threads: int = 0) -> bool:
+    """Poster + webm for one mp4. Returns True if anything was (or would be) done."""
+    outs = video_outputs_for(mp4)
+    mp4_mtime = mp4.stat().st_mtime
+    stale = any_video_output_stale(mp4_mtime, outs)
 
-        if not force and not stale:
-            log(f"Skip (already up-to-date): {mp4.name}")
-            continue
+    if not force and not stale:
+        log(f"Skip (already up-to-date): {mp4.name}")
+        return False
 
+    poster_stale = stale_against(mp4_mtime, outs["poster"])
+    webm_stale = stale_against(mp4_mtime, outs["webm"])
+    t = 1.0
+    if poster_stale:  # the duration only picks the poster timestamp
         dur = probe_duration(mp4)
         t = max(1.0, dur * 0.10 if dur > 0 else 1.0)
 
-        if dry:
-            if not newer_than(mp4, outs["poster"]):
-                log(f"[DRY] Would extract poster {outs['poster'].name} @ {t:.2f}s")
-            if not newer_than(mp4, outs["webm"]):
-                log(f"[DRY] Would encode {outs['webm'].name} from {mp4.name}")
-        else:
-            if not outs["poster"].exists() or not newer_than(mp4, outs["poster"]):
-                extract_poster(mp4, outs["poster"], t)
-            if not outs["webm"].exists() or not newer_than(mp4, outs["webm"]):
-                encode_webm_av1(mp4, outs["webm"])
-        touched += 1
-    return touched
+    if dry:
+        if poster_stale:
+            log(f"[DRY] Would extract poster {outs['poster'].name} @ {t:.2f}s")
+        if webm_stale:
+            log(f"[DRY] Would encode {outs['webm'].name} from {mp4.name}")
+    else:
+        if poster_stale and webm_stale:
+            _process_video_fused(mp4, outs["poster"], outs["webm"], t, threads=threads)
+        elif poster_stale:
+            extract_poster(mp4, outs["poster"], t)
+        elif webm_stale:
+            encode_webm_av1(mp4, outs["webm"], threads=threads)
+    return True
+
+def process_videos(media_dir: Path, force: bool, dry: bool, jobs: Optional[int] = None) -> int:
+    # Work is subprocess-bound, so threads are enough; split the cores between
+    # concurrent ffmpeg processes so total encoder threads ~= CPU count.
+    cpus = os.cpu_count() or 1
+    workers = jobs or max(1, cpus // 4)
+    threads = max(1, cpus // workers)
+    mp4s = sorted(media_dir.glob("video*.mp4"))
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        results = list(ex.map(lambda mp4: _process_one_video(mp4, force, dry, threads), mp4s))
+    return sum(results)
 
 # ---------------- HTML rewrite ----------------
 
-def gather_generated(images_dir: Path, base: str) -> Dict[str,List[Path]]:
-    out = {"webp":[], "avif":[], "fallback":[]}
-    for p in sorted(images_dir.glob(f"{base}-*.webp")): out["webp"].append(p)
-    for p in sorted(images_dir.glob(f"{base}-*.avif")): out["avif"].append(p)
-    for ext in (".jpg",".jpeg",".png"):
-        out["fallback"].extend(sorted(images_dir.glob(f"{base}-*{ext}")))
-    return out
+_EMPTY_BUNDLE: Dict[str, List[Path]] = {"webp":[], "avif":[], "fallback":[]}
 
-def build_srcset(paths: List[Path], html_dir: Path) -> str:
+def _build_variant_index(images_dir: Path) -> Dict[str, Dict[str, List[Path]]]:
+    """One scan of images_dir -> {base: {"webp": [...], "avif": [...], "fallback": [...]}}."""
+    index: Dict[str, Dict[str, List[Path]]] = {}
+    with os.scandir(images_dir) as it:
+        for e in it:
+            m = _WIDTH_EXT_RE.search(e.name)
+            if not m or not e.is_file():
+                continue
+            ext = e.name.rsplit(".", 1)[1].lower()
+            bucket = ext if ext in ("webp", "avif") else "fallback"
+            bundle = index.setdefault(e.name[:m.start()], {"webp":[], "avif":[], "fallback":[]})
+            bundle[bucket].append(images_dir / e.name)
+    for bundle in index.values():
+        for paths in bundle.values():
+            paths.sort(key=lambda p: p.name)
+    return index
+
+def build_srcset(paths: List[Path], start_posix: str) -> str:
     parts = []
     for p in sorted(paths, key=lambda x: x.name):
-        m = re.search(r"-(\d+)\.(?:webp|avif|jpe?g|png)$", p.name)
+        m = _WIDTH_EXT_RE.search(p.name)
         width = (m.group(1) + "w") if m else ""
-        parts.append(f"{relpath(p, html_dir)} {width}".strip())
+        parts.append(f"{_fast_relpath(p.as_posix(), start_posix)} {width}".strip())
     return ", ".join(parts)
 
-def pick_fallback(bundles: Dict[str,List[Path]], target_w: int, html_dir: Path, default_src: str) -> str:
+def pick_fallback(bundles: Dict[str,List[Path]], target_w: int, start_posix: str, default_src: str) -> str:
     if not bundles["fallback"]:
         return default_src
     pick = None
     for p in bundles["fallback"]:
-        m = re.search(r"-(\d+)\.", p.name)
+        m = _WIDTH_DOT_RE.search(p.name)
         if m and int(m.group(1)) == target_w:
             pick = p; break
     if not pick: pick = bundles["fallback"][0]
-    return relpath(pick, html_dir)
+    return _fast_relpath(pick.as_posix(), start_posix)
 
-def wrap_img_to_picture(soup, img, avif_srcset, webp_srcset, fallback_src, sizes_val):
-    picture = soup.new_tag("picture")
+def _attrs_html(attrs: Dict[str, object]) -> str:
+    # bs4 stores multi-valued attributes (class, rel, …) as lists.
+    return " ".join(f'{k}="{escape(" ".join(v) if isinstance(v, list) else str(v))}"' for k, v in attrs.items())
+
+def wrap_img_to_picture(img, avif_srcset, webp_srcset, fallback_src, sizes_val):
+    # Build the stereotyped block as markup and parse it once: far fewer
+    # bs4 calls than new_tag + per-attribute __setitem__.
     attrs = {k:v for k,v in img.attrs.items() if k not in ("src","srcset","sizes")}
-    s1 = soup.new_tag("source", **{"type":"image/avif"}); s1["srcset"] = avif_srcset
-    s2 = soup.new_tag("source", **{"type":"image/webp"}); s2["srcset"] = webp_srcset
-    new_img = soup.new_tag("img", **attrs)
-    new_img["src"] = fallback_src
-    new_img["srcset"] = webp_srcset
-    new_img["sizes"] = sizes_val
-    if "loading" not in new_img.attrs: new_img["loading"] = "lazy"
-    if "decoding" not in new_img.attrs: new_img["decoding"] = "async"
-    picture.append(s1); picture.append(s2); picture.append(new_img)
-    img.replace_with(picture)
+    attrs.update(src=fallback_src, srcset=webp_srcset, sizes=sizes_val)
+    attrs.setdefault("loading", "lazy")
+    attrs.setdefault("decoding", "async")
+    fragment = (
+        f'<picture><source type="image/avif" srcset="{escape(avif_srcset)}">'
+        f'<source type="image/webp" srcset="{escape(webp_srcset)}">'
+        f'<img {_attrs_html(attrs)}></picture>'
+    )
+    img.replace_with(_parse_fragment(fragment).picture)
 
 def update_picture_block(soup, picture, avif_srcset, webp_srcset, fallback_src, sizes_val):
     s_avif = None; s_webp = None
+    # Descendant (not child) lookups: libxml2's HTML parser doesn't treat
+    # <source> as void, so under "lxml" the <img> ends up nested in it.
     for s in picture.find_all("source"):
         if s.get("type") == "image/avif": s_avif = s
         if s.get("type") == "image/webp": s_webp = s
@@ -290,16 +518,19 @@ def update_picture_block(soup, picture, avif_srcset, webp_srcset, fallback_src,
         s_webp = soup.new_tag("source", **{"type":"image/webp"})
         picture.insert(1, s_webp)
     s_webp["srcset"] = webp_srcset
-    img = picture.find("img") or soup.new_tag("img")
+    img = picture.find("img")
+    if img is None:
+        img = soup.new_tag("img")
+        picture.append(img)
     img["src"] = fallback_src
     img["sizes"] = sizes_val
     if "loading" not in img.attrs: img["loading"] = "lazy"
     if "decoding" not in img.attrs: img["decoding"] = "async"
-    if not picture.find("img"): picture.append(img)
 
-def process_html_images(html_file: Path, images_dir: Path, sizes_val: str, widths: List[int], dry: bool):
-    soup = BeautifulSoup(html_file.read_text(encoding="utf-8"), "lxml")
-    html_dir = html_file.parent
+def process_html_images(soup, html_dir: Path, index: Dict[str, Dict[str, List[Path]]], sizes_val: str,
+                        widths: List[int], dry: bool) -> bool:
+    """Rewrite <img>/<picture> blocks in soup in place. Returns True if anything changed."""
+    start_posix = html_dir.as_posix()
     changed = False
 
     # Pass 1: plain <img> not inside <picture>
@@ -308,18 +539,18 @@ def process_html_images(html_file: Path, images_dir: Path, sizes_val: str, width
         src = img.get("src") or img.get("data-src") or ""
         if "assets/images/" not in src: continue
         base = Path(src).stem
-        bundles = gather_generated(images_dir, base)
+        bundles = index.get(base, _EMPTY_BUNDLE)
         if not bundles["webp"] or not bundles["avif"]: continue
 
-        avif_srcset = build_srcset(bundles["avif"], html_dir)
-        webp_srcset = build_srcset(bundles["webp"], html_dir)
-        fallback_src = pick_fallback(bundles, target_w=800, html_dir=html_dir, default_src=src)
+        avif_srcset = build_srcset(bundles["avif"], start_posix)
+        webp_srcset = build_srcset(bundles["webp"], start_posix)
+        fallback_src = pick_fallback(bundles, target_w=800, start_posix=start_posix, default_src=src)
         sizes_attr = img.get("sizes") or sizes_val
 
         if dry:
             log(f"[DRY] Would wrap <img src='{src}'> into <picture>")
         else:
-            wrap_img_to_picture(soup, img, avif_srcset, webp_srcset, fallback_src, sizes_attr)
+            wrap_img_to_picture(img, avif_srcset, webp_srcset, fallback_src, sizes_attr)
             changed = True
 
     # Pass 2: existing <picture>
@@ -328,13 +559,13 @@ def process_html_images(html_file: Path, images_dir: Path, sizes_val: str, width
         if not img: continue
         src = img.get("src") or img.get("data-src") or ""
         if "assets/images/" not in src: continue
-        base = Path(src).stem.split("-")[0]  # handle image-800.jpg
-        bundles = gather_generated(images_dir, base)
+        base = _WIDTH_SUFFIX_RE.sub("", Path(src).stem)  # image-800.jpg -> image; keeps hyphenated slugs
+        bundles = index.get(base, _EMPTY_BUNDLE)
         if not bundles["webp"] or not bundles["avif"]: continue
 
-        avif_srcset = build_srcset(bundles["avif"], html_dir)
-        webp_srcset = build_srcset(bundles["webp"], html_dir)
-        fallback_src = pick_fallback(bundles, target_w=800, html_dir=html_dir, default_src=src)
+        avif_srcset = build_srcset(bundles["avif"], start_posix)
+        webp_srcset = build_srcset(bundles["webp"], start_posix)
+        fallback_src = pick_fallback(bundles, target_w=800, start_posix=start_posix, default_src=src)
         sizes_attr = img.get("sizes") or sizes_val
 
         if dry:
@@ -343,29 +574,24 @@ def process_html_images(html_file: Path, images_dir: Path, sizes_val: str, width
             update_picture_block(soup, picture, avif_srcset, webp_srcset, fallback_src, sizes_attr)
             changed = True
 
-    if changed and not dry:
-        b = backup_file(html_file)
-        log(f"Backed up HTML to {b.name}")
-        html_file.write_text(soup.prettify(formatter="html5"), encoding="utf-8")
-        ok(f"Updated HTML images in {html_file.name}")
-    elif not changed:
+    if not changed:
         log("No image HTML changes needed.")
+    return changed
 
-def process_html_videos(html_file: Path, media_dir: Path, dry: bool):
-    soup = BeautifulSoup(html_file.read_text(encoding="utf-8"), "lxml")
-    html_dir = html_file.parent
+def process_html_videos(soup, html_dir: Path, media_dir: Path, dry: bool) -> bool:
+    """Rewrite <video> blocks in soup in place. Returns True if anything changed."""
     changed = False
 
     for vid in list(soup.find_all("video")):
         base = None
 
         direct = vid.get("src") or vid.get("data-src") or ""
-        m = re.search(r"assets/media/(video\d+)\.mp4$", direct)
+        m = _MP4_RE.search(direct)
         if m: base = m.group(1)
         if not base:
             for s in vid.find_all("source"):
                 ssrc = s.get("src") or s.get("data-src") or ""
-                m = re.search(r"assets/media/(video\d+)\.mp4$", ssrc)
+                m = _MP4_RE.search(ssrc)
                 if m: base = m.group(1); break
         if not base:
             continue
@@ -381,21 +607,78 @@ def process_html_videos(html_file: Path, media_dir: Path, dry: bool):
         vid["preload"] = vid.get("preload") or "none"
 
         for s in vid.find_all("source"): s.decompose()
-        s_webm = soup.new_tag("source"); s_webm["type"] = "video/webm"
-        s_mp4  = soup.new_tag("source"); s_mp4["type"]  = "video/mp4"
-        s_webm["data-src"] = relpath(webm, html_dir) if webm.exists() else f"assets/media/{base}.webm"
-        s_mp4["data-src"]  = relpath(mp4,  html_dir) if mp4.exists()  else f"assets/media/{base}.mp4"
-        vid.append(s_webm); vid.append(s_mp4)
+        webm_src = relpath(webm, html_dir) if webm.exists() else f"assets/media/{base}.webm"
+        mp4_src  = relpath(mp4,  html_dir) if mp4.exists()  else f"assets/media/{base}.mp4"
+        fragment = (
+            f'<video><source type="video/webm" data-src="{escape(webm_src)}">'
+            f'<source type="video/mp4" data-src="{escape(mp4_src)}"></video>'
+        )
+        for s in _parse_fragment(fragment).video.find_all("source"):
+            vid.append(s)
 
         changed = True
 
-    if changed and not dry:
-        b = backup_file(html_file)
-        log(f"Backed up HTML to {b.name}")
-        html_file.write_text(soup.prettify(formatter="html5"), encoding="utf-8")
-        ok(f"Updated HTML videos in {html_file.name}")
-    elif not changed:
+    if not changed:
         log("No video HTML changes needed.")
+    return changed
+
+def _latest_mtime(dirs: List[Path]) -> float:
+    """Newest mtime among dirs and their files.
+
+    A directory's own mtime moves on add/delete/rename, which catches deleted
+    variants and files copied in with preserved (old) mtimes.
+    """
+    latest = 0.0
+    for d in dirs:
+        if not d.exists():
+            continue
+        latest = max(latest, d.stat().st_mtime)
+        with os.scandir(d) as it:
+            for e in it:
+                if e.is_file():
+                    latest = max(latest, e.stat().st_mtime)
+    return latest
+
+def _html_state_key(html_file: Path, passes: str, sizes: str) -> str:
+    # sizes= is written into every <img>, so a new value must force a rewrite.
+    return f"{html_file}:{passes}:{sizes}"
+
+def _html_up_to_date(html_file: Path, dirs: List[Path], passes: str, sizes: str) -> bool:
+    """True if html_file is unchanged since our last rewrite and newer than every file in dirs.
+
+    The recorded mtime guards against hand edits (e.g. a new <img>) that
+    would otherwise look "newer than the variants" and be skipped.
+    """
+    st = html_file.stat()
+    if HTML_STATE.get(_html_state_key(html_file, passes, sizes)) != st.st_mtime_ns:
+        return False
+    return st.st_mtime >= _latest_mtime(dirs)
+
+def _record_html_state(html_file: Path, passes: str, sizes: str):
+    global _cache_dirty
+    HTML_STATE[_html_state_key(html_file, passes, sizes)] = html_file.stat().st_mtime_ns
+    _cache_dirty = True
+
+def _parse(html_text: str) -> BeautifulSoup:
+    """Parse with lxml (C tokenizer) when installed, else the stdlib html.parser."""
+    try:
+        return BeautifulSoup(html_text, "lxml")
+    except FeatureNotFound:
+        return BeautifulSoup(html_text, "html.parser")
+
+def _parse_fragment(markup: str) -> BeautifulSoup:
+    """Parse a small generated snippet. html.parser knows <source>/<img> are
+    void, so siblings stay siblings (libxml2 would nest them)."""
+    return BeautifulSoup(markup, "html.parser")
+
+def write_html(html_file: Path, soup, pretty: bool = False):
+    b = backup_file(html_file)
+    log(f"Backed up HTML to {b.name}")
+    if pretty:  # re-indents every node; slow, only useful for eyeballing diffs
+        html_file.write_text(soup.prettify(formatter="html5"), encoding="utf-8")
+    else:
+        html_file.write_bytes(soup.encode(formatter="html5"))
+    ok(f"Updated HTML in {html_file.name}")
 
 # ---------------- CLI ----------------
 
@@ -411,6 +694,11 @@ def main():
     p.add_argument("--force-images", action="store_true", help="Force-regenerate image variants even if up-to-date.")
     p.add_argument("--force-videos", action="store_true", help="Force-regenerate poster/webm even if up-to-date.")
     p.add_argument("--no-fallback-raster", action="store_true", help="Skip JPEG/PNG fallbacks for images.")
+    p.add_argument("--jobs", type=int, default=None, help="Parallel image encode workers (default: CPU count).")
+    p.add_argument("--avif-encoder", choices=["svt","aom"], default="svt", help="AV1 encoder for AVIF stills (default: svt).")
+    p.add_argument("--video-jobs", type=int, default=None, help="Concurrent ffmpeg video jobs (default: CPU count / 4).")
+    p.add_argument("--force-html", action="store_true", help="Rewrite HTML even if it is newer than every variant.")
+    p.add_argument("--pretty", action="store_true", help="Pretty-print the rewritten HTML (slower).")
     p.add_argument("--dry-run", action="store_true", help="Show actions without writing files.")
     args = p.parse_args()
 
@@ -429,9 +717,14 @@ def main():
         if not args.dry_run:
             media.mkdir(parents=True, exist_ok=True)
 
-    # Preflight for video tools only if we're processing videos
+    load_cache(persist=not args.dry_run)
+
+    # Preflight: ffmpeg for videos, and for images when Pillow can't write AVIF
     do_images = not args.only_videos
     do_videos = not args.only_images
+    if do_images and not args.dry_run and not pillow_can_save_avif() and not which("ffmpeg"):
+        err("ffmpeg not found on PATH and Pillow has no AVIF support; one of them is needed for images.")
+        sys.exit(1)
     if do_videos:
         for exe in ("ffmpeg","ffprobe"):
             if not which(exe):
@@ -445,15 +738,37 @@ def main():
             images, args.widths,
             make_fallback=not args.no_fallback_raster,
             force=args.force_images,
-            dry=args.dry_run
+            dry=args.dry_run,
+            jobs=args.jobs,
+            avif_encoder=args.avif_encoder
         )
-        process_html_images(html, images, args.sizes, args.widths, dry=args.dry_run)
 
     # Videos
     if do_videos:
         log("Processing videos…")
-        process_videos(media, force=args.force_videos, dry=args.dry_run)
-        process_html_videos(html, media, dry=args.dry_run)
+        process_videos(media, force=args.force_videos, dry=args.dry_run, jobs=args.video_jobs)
+
+    # HTML: parse once, apply both passes, write (and back up) once
+    passes = "+".join(filter(None, ["images" if do_images else "", "videos" if do_videos else ""]))
+    dirs = ([images] if do_images else []) + ([media] if do_videos else [])
+    sizes = args.sizes if do_images else ""
+    if not args.force_html and _html_up_to_date(html, dirs, passes, sizes):
+        log(f"Skip HTML (already up-to-date): {html.name}")
+    else:
+        soup = _parse(html.read_text(encoding="utf-8"))
+        changed = False
+        if do_images:
+            index = _build_variant_index(images)
+            changed |= process_html_images(soup, html.parent, index, args.sizes, args.widths, dry=args.dry_run)
+        if do_videos:
+            changed |= process_html_videos(soup, html.parent, media, dry=args.dry_run)
+        if not args.dry_run:
+            if changed:
+                write_html(html, soup, pretty=args.pretty)
+            # Nothing written and still older than the assets: the skip could
+            # never fire, so don't record state for it.
+            if changed or html.stat().st_mtime >= _latest_mtime(dirs):
+                _record_html_state(html, passes, sizes)
 
     ok("Done.")
 